@@ -2,7 +2,6 @@ import os
 import json
 import tqdm
 import sys
-import time
 import re
 from multiprocessing import Pool
 
@@ -20,10 +19,10 @@ def load_txt(path):
     # Open file `f` in text mode with 'UTF-8' encoding (handle text data that may contain non-ASCII characters)
     # and 'ignore' errors parameter to ignore any decoding errors encountered while reading the file
     with open(path, encoding='UTF-8', errors='ignore') as f:
-        # `f.readlines()` returns a list of strings where each string represents a line in the file
-        # Iterates over each line `i` in the file and applies `strip()` to remove any leading or trailing whitespace characters
-        # Filters out empty lines by checking whether the length of stripped line `len(i.strip())` is greater than 0
-        data = [i.strip() for i in f.readlines() if len(i.strip()) > 0]
+        # Iterating over `f` directly reads the file line by line, no intermediate list of raw lines is built
+        # Iterates over each line `i` in the file and applies `strip()` once to remove any leading or trailing whitespace characters
+        # Filters out empty lines, an empty stripped line `s` is falsy
+        data = [s for s in (i.strip() for i in f) if s]
     return data
 
 
@@ -43,6 +42,24 @@ def save_txt(data, path):
         f.write(data)
 
 
+def save_lines(data, path):
+    """
+    Save lines of text into a file, separated by '\\n', without joining them into one string first.
+
+    Args:
+        data (iterable): The lines to be saved, can be a generator.
+        path (str): The string path to the file.
+
+    """
+    # Open file `f` in write mode 'w' with a 1MB buffer, so the lines are written to disk in large blocks
+    with open(path, 'w', encoding='UTF-8', buffering=1024 * 1024) as f:
+        # Write '\n' before every line except the first one, the file does not end with '\n' just like `"\n".join()`
+        for i, line in enumerate(data):
+            if i:
+                f.write("\n")
+            f.write(line)
+
+
 def load_jsonl(path):
     """
     Read a file in the JSON Lines format.
@@ -64,11 +81,11 @@ def load_jsonl(path):
     """
     # Open file `f` in read mode 'r' to load the content of the file
     with open(path, 'r', encoding='UTF_8') as f:
-        # `f.readlines()` reads all lines from the file
-        # Iterate over each line `line` and filter out empty whitespace stripped lines `len(line.strip()) > 0`
+        # Iterating over `f` directly reads the file line by line, no intermediate list of raw lines is built
+        # Iterate over each line `line` and filter out empty whitespace stripped lines `line.strip()`
         # `json.loads(line)` parses each line as a JSON object and create a dictionary, for example {'name': 'John'}
         # Return a list containing all the dictionaries
-        return [json.loads(line) for line in f.readlines() if len(line.strip()) > 0]
+        return [json.loads(line) for line in f if line.strip()]
 
 
 def save_jsonl(data, path):
@@ -80,13 +97,19 @@ def save_jsonl(data, path):
         data (list): A list of dictionaries, where each dictionary represents a JSON object.
     
     """
-    # Open file `f` in write mode 'w' to indicate existing content of file might be overwritten
-    with open(path, 'w', encoding='UTF-8') as f:
-        # For each `line` from the `data`, use `json.dumps()` to convert dictionary into JSON string representation
-        # `ensure_ascii=False` to ensure non-ASCII characters are properly encoded
-        # Each JSON string from `line` is added with '\n' as separator with `str.join()`
-        # Creates a string where each JSON object is on a separate line, adhering to JSONL format and write to `f`
-        f.write("\n".join(json.dumps(line, ensure_ascii=False) for line in data))
+    # For each `line` from the `data`, use `json.dumps()` to convert dictionary into JSON string representation
+    # `ensure_ascii=False` to ensure non-ASCII characters are properly encoded
+    # `separators=(",", ":")` removes the whitespace after separators to produce compact JSON
+    # The JSON strings are generated lazily and written by `save_lines`, one object per line, adhering to JSONL format
+    save_lines((json.dumps(line, ensure_ascii=False, separators=(",", ":")) for line in data), path)
+
+
+# This pattern is used to find mentions, it is shared by `no_at` and `contain_at`
+# It matches one or more '@' characters followed by up to 30 non-whitespace characters and a space
+# `r""` is raw string notation to preserve the literal characters without interpreting escape sequences
+# `(@+)` is capturing group `(...)` that matches one or more `+` consecutive '@' characters
+# `\S{,30}` matches any non-whitespace character `\S` between 0 and 30 occurences `{,30}`
+AT_REGEX = re.compile(r"(@+)\S{,30} ")
 
 
 def no_at(seq, tail_length=30):
@@ -102,21 +125,18 @@ def no_at(seq, tail_length=30):
     
     Examples:
         input: "@john have you reported to @anna ?"
-        output: "have you reported to"
+        output: "have you reported to ?"
 
     """
-    # Create a regular expression pattern using `re.compile` that matches one or more '@' characters
-    # followed by up to 30 non-whitespace characters and a space
-    # `r""` is raw string notation to preserve the literal characters without interpreting escape sequences
-    # `(@+)` is capturing group `(...)` that matches one or more `+` consecutive '@' characters 
-    # `\S{,30}` matches any non-whitespace character `\S` between 0 and 30 occurences `{,30}`
-    temp_pat = re.compile(r"(@+)\S{,30} ")
-    # Use `sub` to substitute all matches found in the input string `seq` with an empty string (remove)
-    seq = temp_pat.sub("", seq)
+    # Most sequences contain no '@' at all, a plain substring check avoids running the regex for them
+    if "@" not in seq:
+        return seq
+    # Use `sub` to substitute all matches of `AT_REGEX` found in the input string `seq` with an empty string (remove)
+    seq = AT_REGEX.sub("", seq)
     # Find the last occurence of '@' in the modified string `seq` using `rfind` and return index position (-1 if not found)
     r_at_idx = seq.rfind("@")
-    # Check if the length of remaining substring from the last '@' is shorter than `tail_length`
-    if len(seq[r_at_idx:]) < tail_length:
+    # Check if there is a remaining '@' and the length of remaining substring from it is shorter than `tail_length`
+    if r_at_idx > -1 and len(seq[r_at_idx:]) < tail_length:
         # Preserve only the string `seq` up to the index position and remove the tail
         seq = seq[:r_at_idx]
     return seq
@@ -156,6 +176,22 @@ def is_chinese_char(cp):
     return False
 
 
+# This pattern is used to find any character in the CJK Unicode ranges, it covers the same ranges as `is_chinese_char`
+# `[...]` is character class that matches a single character belonging to any of the listed ranges
+CJK_REGEX = re.compile(
+    "["
+    "\u4E00-\u9FFF"
+    "\u3400-\u4DBF"
+    "\U00020000-\U0002A6DF"
+    "\U0002A700-\U0002B73F"
+    "\U0002B740-\U0002B81F"
+    "\U0002B820-\U0002CEAF"
+    "\uF900-\uFAFF"
+    "\U0002F800-\U0002FA1F"
+    "]"
+)
+
+
 def contains_Chinese(seq):
     """
     Check whether a given string sequence contains Chinese characters.
@@ -167,12 +203,8 @@ def contains_Chinese(seq):
         boolean: True if it contains Chinese characters.
 
     """
-    for char in seq:
-        # `ord` to convert character `char` to a Unicode code point `cp`
-        cp = ord(char)
-        if is_chinese_char(cp):
-            return True
-    return False
+    # `search` scans the whole string inside the regex engine and stops at the first CJK character
+    return CJK_REGEX.search(seq) is not None
 
 
 def contain_at(seq, tail_length=30):
@@ -185,13 +217,11 @@ def contain_at(seq, tail_length=30):
     Returns:
         boolean: True if it contains '@'.
     """
-    # Create a regular expression pattern using `re.compile` that matches one or more '@' characters
-    # followed by up to 30 non-whitespace characters and a space
-    # `r""` is raw string notation to preserve the literal characters without interpreting escape sequences
-    # `(@+)` is capturing group `(...)` that matches one or more `+` consecutive '@' characters 
-    # `\S{,30}` matches any non-whitespace character `\S` between 0 and 30 occurences `{,30}`
-    flag = re.search(r"(@+)\S{,30} ", seq)
-    # True if there is sequence matching the pattern
+    # Most sequences contain no '@' at all, a plain substring check avoids running the regex for them
+    if "@" not in seq:
+        return False
+    flag = AT_REGEX.search(seq)
+    # True if there is sequence matching the `AT_REGEX` pattern
     if flag is not None:
         return True
     # Use `rfind` to find the index of last occurence of '@'
@@ -202,11 +232,10 @@ def contain_at(seq, tail_length=30):
     return False
 
 
-# This pattern is used to find occurences of letters "tm" surrounded by non-alphabetic characters, when it is not part of a larger word.
-# `([^a-zA-Z])` matches any non-alphabetic character (uppercase or lowercase)
-# `(tm)` matches the letters "tm" literally
-# `re.I` is flag indicating case-insensitive matching
-TM_REGEX = re.compile(r"([^a-zA-Z])(tm)([^a-zA-Z])", re.I)
+# This pattern is used to find occurences of ellipsis ("...") followed by optional whitespace and phrase "show all" in Chinese, such as "…显示全部"
+# `…*` matches zero or more ellipsis characters
+# ` *` and `\s*` match optional whitespace characters before and after the phrase
+ZHIHU_SHOW_ALL_REGEX = re.compile(r"…* *显示全部\s*")
 
 # This pattern is used to find occurences of text enclosed in square brackets, such as "[example text]".
 # `\[` and `\]` matches the opening and closing square brackets
@@ -226,6 +255,12 @@ BRACKETS_REGEX3 = re.compile(r"【.*?】 *")
 # `{4,}` matches four or more consecutive occurences of the preceeding pattern
 COLON_REGEX = re.compile(r"[:\s]{4,}")
 
+# This pattern is used to find occurences of letters "tm" surrounded by non-alphabetic characters, when it is not part of a larger word.
+# `(?<=[^a-zA-Z])` and `(?=[^a-zA-Z])` are lookbehind and lookahead, they check the surrounding characters without consuming them
+# so the matches can be replaced with an empty string directly
+# `re.I` is flag indicating case-insensitive matching
+TM_REGEX = re.compile(r"(?<=[^a-zA-Z])tm(?=[^a-zA-Z])", re.I)
+
 
 def seq_clean(seq, data_type="none"):
     """
@@ -240,10 +275,8 @@ def seq_clean(seq, data_type="none"):
 
     """
     if data_type == "zhihu":
-        # Create pattern `pat` to match occurences of ellipsis ("...") followed by optional whitespace and phrase "show all" in Chinese
-        pat = re.compile(r"…* *显示全部\s*")
-        # Remove the matched pattern object from the input string `seq`
-        seq = pat.sub("", seq)
+        # Remove the matched pattern object of ellipsis followed by phrase "show all" in Chinese from the input string `seq`
+        seq = ZHIHU_SHOW_ALL_REGEX.sub("", seq)
     elif data_type == "weibo_tang":
         # Remove the matched pattern object of text enclosed in square brackets along with trailing whitespace
         seq = BRACKETS_REGEX.sub("", seq)
@@ -255,16 +288,45 @@ def seq_clean(seq, data_type="none"):
     if "尼玛" in seq:
         seq = ""
     # Remove the matched pattern object of colons or whitespace characters
+    # Each of the following passes works on the result of the previous one, so their order matters
     seq = COLON_REGEX.sub("", seq)
     # Remove specific substring from `seq`, such as "[image]", " [image] " and exclamation in Chinese
     seq = seq.replace("[图片]", "")
     seq = seq.replace("［图片］", "")
     seq = seq.replace("我擦", "")
-    # Remove trademark symbol "tm" surrounded by non-alphabetic characters. Replace the matches with characters before and after "tm"
-    seq = TM_REGEX.sub(lambda m: m.group(1) + m.group(3), seq)
+    # Remove trademark symbol "tm" surrounded by non-alphabetic characters, the characters before and after "tm" are kept
+    seq = TM_REGEX.sub("", seq)
     return seq
 
 
+def dialog_prefixes(dialogs, min_length=5):
+    """
+    Generate every prefix of each dialog that ends with a response of at least `min_length`, joined by the tab separator.
+
+    Args:
+        dialogs (list): A list of dialogs, each dialog is a list of at least 2 sequences.
+        min_length (int): Specifies the minimum length of the last sequence of a prefix. Default is 5.
+
+    Returns:
+        generator: Strings of the prefixes, the shortest prefix holds the first 2 sequences of a dialog.
+
+    Examples:
+        input: [["a", "hello", "hi", "how are you"]], min_length=5
+        output: "a\t\thello", "a\t\thello\t\thi\t\thow are you"
+
+    """
+    for dialog in dialogs:
+        # The sequences of the current prefix are collected in `parts` instead of slicing the dialog for every prefix
+        # They are only joined when the prefix is yielded, so prefixes ending with a short response are never built
+        # This is faster than slicing when several responses reach `min_length`, and costs one `append` per sequence
+        # otherwise, which makes long dialogs where only the last response qualifies slightly slower
+        parts = [dialog[0]]
+        for seq in dialog[1:]:
+            parts.append(seq)
+            if len(seq) >= min_length:
+                yield "\t\t".join(parts)
+
+
 def single_func(path, outpath, extra_func=False, min_length=5, max_length=200):
     """
     Process input file to generate output file that contains dialog data.
@@ -285,26 +347,34 @@ def single_func(path, outpath, extra_func=False, min_length=5, max_length=200):
         # Load the input data from path, which is list of strings, each string correspond to one line from the original file
         # data = load_jsonl(path)
         data = load_txt(path)
-        # Each string is split by the tab characters and stored as nested list in the `data`
-        data = [x.split("\t\t") for x in data]
+        # Lines without the "\t\t" separator are dropped as they hold a single sequence and can never form a dialog of at least 2 sequences
+        data = [x for x in data if "\t\t" in x]
+        total = len(data)
+        # Each string is split by the tab characters lazily, so the nested lists of all dialogs never exist at the same time
+        # Spaces are removed from every sequence after splitting, so that a "\t \t" run is not turned into a separator
+        # Only a space right after a tab can join two tabs, lines without "\t " remove their spaces once on the whole line instead
+        data = (x.replace(" ", "").split("\t\t") if "\t " not in x else [seq.replace(" ", "") for seq in x.split("\t\t")]
+                for x in data)
+        # The type of data only depends on the file path, so it is determined once per file instead of once per sequence
+        # `data_type` is None when no extra cleaning is required
+        if not extra_func:
+            data_type = None
+        elif "zhihu" in path:
+            data_type = "zhihu"
+        elif "weibo_tang" in path or "weibo_sunhao" in path:
+            data_type = "weibo_tang"
+        else:
+            data_type = "none"
         # Each list in `data` is treated as `dialog` and iterated using `tqdm.tqdm` to display progress bar
-        for dialog in tqdm.tqdm(data):
+        # The bar is refreshed at most every 10000 dialogs and 2 seconds, and disabled when stderr is not a terminal (e.g. redirected to a log)
+        for dialog in tqdm.tqdm(data, total=total, miniters=10000, mininterval=2.0, disable=not sys.stderr.isatty()):
+            # Perform cleaning on every sequence of the dialog if specified, before the validity of each sequence is checked
+            if data_type is not None:
+                dialog = [seq_clean(seq, data_type) for seq in dialog]
             # Initialize to store processed sequence for each dialog
             new_dialog = []
-            # Each list in `dialog` is treated as `seq`
+            # Each cleaned element in `dialog` is treated as `seq`
             for seq in dialog:
-                # Leading and trailing spaces are removed
-                seq = seq.replace(" ", "")
-                # Perform cleaning if specified
-                if extra_func:
-                    if "zhihu" in path:
-                        data_type = "zhihu"
-                    elif "weibo_tang" in path or "weibo_sunhao" in path:
-                        data_type = "weibo_tang"
-                    else:
-                        data_type = "none"
-                    seq = seq_clean(seq, data_type)
-
                 length = len(seq)
                 # If length of `seq` is more than max_length, less than 1, or contains "http", considered inalid
                 if length > max_length or length < 1 or "http" in seq:
@@ -322,42 +392,73 @@ def single_func(path, outpath, extra_func=False, min_length=5, max_length=200):
                 # if not flag:
                 new_data.append(new_dialog)
         # save_jsonl(new_data, outpath)
-        # Construct `new_data` list by joining the sequences within each dialog using the tab separator
-        new_data = ["\t\t".join(x[:j + 1]) for x in new_data for j in range(1, len(x)) if len(x[j]) >= min_length]
-        save_txt("\n".join(new_data), outpath)
+        # Generate the output lines by joining the sequences within each dialog using the tab separator
+        # A generator is used so that the lines are written one by one instead of being held in memory together
+        save_lines(dialog_prefixes(new_data, min_length), outpath)
         print("over", path)
     except Exception as e:
         print("error!!!!", e)
     return
 
 
-def main(indir, outdir, extra_func=False):
-    """Performs processing on multiple text files in a directory `indir`. Uses multiprocessing to parallelize the processing and saves the results to output files in `outdir`."""
-    paths = [os.path.join(instance[0], file)
-             for instance in list(os.walk(indir))
-             for file in instance[-1] if file.endswith(".txt")]
+def _worker(args):
+    """Unpack a `(path, outpath, extra_func)` tuple from `Pool.imap_unordered` and call `single_func`."""
+    return single_func(*args)
+
+
+def walk_txt(root):
+    """
+    Recursively yield the paths of the ".txt" files under a directory.
+
+    Args:
+        root (str): Path to the directory.
+
+    Returns:
+        generator: Paths of the ".txt" files, yielded while the directory tree is being scanned.
+
+    """
+    # `os.scandir` returns the entries of one directory with their type, so no extra `stat` call is needed per file
+    try:
+        entries = os.scandir(root)
+    except OSError:
+        # Missing or unreadable directories are skipped, same as `os.walk`
+        return
+    with entries:
+        for entry in entries:
+            # Symbolic links to directories are not followed, same as `os.walk`
+            if entry.is_dir(follow_symlinks=False):
+                yield from walk_txt(entry.path)
+            elif entry.name.endswith(".txt"):
+                yield entry.path
+
+
+def iter_tasks(indir, outdir, extra_func=False):
+    """Yield a `(path, outpath, extra_func)` tuple for each ".txt" file in `indir`, creating the output directory of each file before it is yielded."""
+    # Output directories already created, so `os.makedirs` is called once per directory instead of once per file
+    # `exist_ok=True` makes it safe if the directory appears in between, e.g. created by another run
+    created_dirs = set()
+    for path in walk_txt(indir):
+        outpath = path.replace(indir, outdir)
+        outsubdir = os.path.dirname(outpath)
+        if outsubdir not in created_dirs:
+            os.makedirs(outsubdir, exist_ok=True)
+            created_dirs.add(outsubdir)
+        yield path, outpath, extra_func
 
-    outpaths = [path.replace(indir, outdir) for path in paths]
 
+def main(indir, outdir, extra_func=False):
+    """Performs processing on multiple text files in a directory `indir`. Uses multiprocessing to parallelize the processing and saves the results to output files in `outdir`."""
     # debug single
-    # path, outpath = next(zip(paths, outpaths))
-    # outsubdir = os.path.dirname(outpath)
-    # if not os.path.exists(outsubdir):
-    #     os.makedirs(outsubdir)
-    # single_func(path, outpath, extra_func)
+    # single_func(*next(iter_tasks(indir, outdir, extra_func)))
     # exit()
 
-    p = Pool(16)
     print("start")
-    for path, outpath in zip(paths, outpaths):
-        outsubdir = os.path.dirname(outpath)
-        if not os.path.exists(outsubdir):
-            os.makedirs(outsubdir)
-        p.apply_async(single_func, args=(path, outpath, extra_func))
-        time.sleep(0.01)
-    time.sleep(0.01)
-    p.close()
-    p.join()
+    # The tasks are generated lazily, so workers start processing files while the directory tree is still being scanned
+    # Each task is a whole file, the IPC overhead is small compared to processing it, so tasks are handed out one by one to balance the load
+    # Iterating over the results waits for every file to be processed before the pool is closed
+    with Pool(16) as p:
+        for _ in p.imap_unordered(_worker, iter_tasks(indir, outdir, extra_func), chunksize=1):
+            pass
     print("over")
 
 
@@ -14,7 +14,7 @@ def load_pkl(path):
 
 def load_txt(path):
     with open(path, encoding='UTF-8', errors='ignore') as f:
-        data = [i.strip() for i in f.readlines() if len(i.strip()) > 0]
+        data = [s for s in (i.strip() for i in f) if s]
     return data
 
 
@@ -35,17 +35,21 @@ def save_json(data, path, indent=0):
 
 def load_jsonl(path):
     with open(path, 'r', encoding='UTF_8') as f:
-        return [json.loads(line) for line in f.readlines() if len(line.strip()) > 0]
+        return [json.loads(line) for line in f if line.strip()]
 
 
 def save_jsonl(data, path):
-    with open(path, 'w', encoding='UTF-8') as f:
-        f.write("\n".join(json.dumps(line, ensure_ascii=False) for line in data))
+    with open(path, 'w', encoding='UTF-8', buffering=1024 * 1024) as f:
+        # no trailing "\n", `wc_count` counts the last line without one
+        for i, line in enumerate(data):
+            if i:
+                f.write("\n")
+            f.write(json.dumps(line, ensure_ascii=False, separators=(",", ":")))
 
 
 def load_gz_jsonl(path):
     with gzip.open(path, "rb") as f:
-        return [json.loads(line) for line in f.readlines() if len(line.strip()) > 0]
+        return [json.loads(line) for line in f if line.strip()]
 
 
 def load_lines(path, start, end):
@@ -17,12 +17,11 @@ def simple_dataloader(dir_path, out_dir, batch_size):
     # random.shuffle(jsonl_path_list)
     for file, subdir_name, path in jsonl_path_list:
         dataset = load_jsonl(path)
+        # out
+        out_subdir = os.path.join(cleaned_dir, subdir_name)
+        os.makedirs(out_subdir, exist_ok=True)
         for i in range(0, len(dataset), batch_size):
             fid = subdir_name + "_" + file.replace(".jsonl", "") + "_trunc" + str(i)
-            # out
-            out_subdir = os.path.join(cleaned_dir, subdir_name)
-            if not os.path.exists(out_subdir):
-                os.mkdir(out_subdir)
             out_path = os.path.join(out_subdir, fid + ".jsonl")
             yield fid, dataset[i: i + batch_size], out_path
 
@@ -46,11 +45,10 @@ def paths_dataloader(dir_path, out_dir, batch_size):
             file_len = wc_count(path)
         else:
             raise Exception
+        # out
+        out_subdir = os.path.join(cleaned_dir, subdir_name)
+        os.makedirs(out_subdir, exist_ok=True)
         for i in range(0, file_len, batch_size):
             fid = subdir_name + "_" + file.replace(".jsonl", "") + "_trunc" + str(i)
-            # out
-            out_subdir = os.path.join(cleaned_dir, subdir_name)
-            if not os.path.exists(out_subdir):
-                os.mkdir(out_subdir)
             out_path = os.path.join(out_subdir, fid + ".txt")
             yield fid, path, i, i + batch_size, out_path
@@ -7,6 +7,8 @@ from nltk.corpus import wordnet
 
 NO_SPECIFIC = {"repost", "转发", "repostweibo", "分享图片"}
 DE_SPECIFIC = {"[图片]", "［图片］", "{ n楷体 s14}", "{ }", "{\\1c&H4080FF&}", "我擦", "\u200b"}
+# longest first, so that an alternative never shadows a longer one sharing its prefix
+DE_SPECIFIC_REGEX = re.compile("|".join(re.escape(x) for x in sorted(DE_SPECIFIC, key=len, reverse=True)))
 
 # "哈哈 sda83daj.jp 哈哈"
 ALPHA_NUM_REGEX = re.compile(r" [a-zA-Z0-9.]+ ")
@@ -35,17 +37,23 @@ WEIBO_EMOJI_REGEX = re.compile(r"[?(?:. ?){1,10} ?]")
 # COMMON_MENTION_REGEX = re.compile(r"(@+)\S+")
 # COMMON_MENTION_REGEX = re.compile(r"(@+)(.*?):")
 # COMMON_MENTION_REGEX = re.compile(r"(@+)(\S*?\s*?): *")
+AT_REGEX = re.compile(r"(@+)\S{,30} ")
+
+
 def no_at(seq, tail_length=30):
-    temp_pat = re.compile(r"(@+)\S{,30} ")
-    seq = temp_pat.sub("", seq)
+    if "@" not in seq:
+        return seq
+    seq = AT_REGEX.sub("", seq)
     r_at_idx = seq.rfind("@")
-    if len(seq[r_at_idx:]) < tail_length:
+    if r_at_idx > -1 and len(seq[r_at_idx:]) < tail_length:
         seq = seq[:r_at_idx]
     return seq
 
 
 def contain_at(seq, tail_length=30):
-    flag = re.search(r"(@+)\S{,30} ", seq)
+    if "@" not in seq:
+        return False
+    flag = AT_REGEX.search(seq)
     if flag is not None:
         return True
     r_at_idx = seq.rfind("@")
@@ -112,7 +120,7 @@ QQ_REGEX = re.compile(r"[qQ]{2,}\d{5,12}\D")
 
 COLON_REGEX = re.compile(r"[:\s]{4,}")
 
-TM_REGEX = re.compile(r"([^a-zA-Z])(tm)([^a-zA-Z])", re.I)
+TM_REGEX = re.compile(r"(?<=[^a-zA-Z])tm(?=[^a-zA-Z])", re.I)
 
 # func
 def too_short(utter, length=2):
@@ -150,30 +158,32 @@ def remove_emoji2(utter):
     return None
 
 
+EMOJI_REGEX = re.compile(
+    "["
+    "\U0001F600-\U0001F64F"
+    "\U0001F300-\U0001F5FF"
+    "\U0001F680-\U0001F6FF"
+    "\U0001F1E0-\U0001F1FF"
+    "\U00002500-\U00002BEF"
+    "\U0001f926-\U0001f937"
+    "\U00010000-\U0010ffff"
+    "\u2640-\u2642"
+    "\u2600-\u2B55"
+    "\u200d"
+    "\u23cf"
+    "\u23e9"
+    "\u231a"
+    "\ufe0f"
+    "\u3030"
+    "\\*\u20e3"
+    "#\u20e3"
+    "]+",
+    flags=re.UNICODE,
+)
+
+
 def remove_emoji3(text):
-    emoji_regex = re.compile(
-        "["
-        "\U0001F600-\U0001F64F"
-        "\U0001F300-\U0001F5FF"
-        "\U0001F680-\U0001F6FF"
-        "\U0001F1E0-\U0001F1FF"
-        "\U00002500-\U00002BEF"
-        "\U0001f926-\U0001f937"
-        "\U00010000-\U0010ffff"
-        "\u2640-\u2642"
-        "\u2600-\u2B55"
-        "\u200d"
-        "\u23cf"
-        "\u23e9"
-        "\u231a"
-        "\ufe0f"
-        "\u3030"
-        "\\*\u20e3"
-        "#\u20e3"
-        "]+",
-        flags=re.UNICODE,
-    )
-    text = emoji_regex.sub(r"", text)
+    text = EMOJI_REGEX.sub(r"", text)
     return text.strip()
 
 
@@ -263,12 +273,22 @@ def is_chinese_char(cp):
     )
 
 
+CJK_REGEX = re.compile(
+    "["
+    "\u4E00-\u9FFF"
+    "\u3400-\u4DBF"
+    "\U00020000-\U0002A6DF"
+    "\U0002A700-\U0002B73F"
+    "\U0002B740-\U0002B81F"
+    "\U0002B820-\U0002CEAF"
+    "\uF900-\uFAFF"
+    "\U0002F800-\U0002FA1F"
+    "]"
+)
+
+
 def contains_Chinese(seq):
-    for char in seq:
-        cp = ord(char)
-        if is_chinese_char(cp):
-            return True
-    return False
+    return CJK_REGEX.search(seq) is not None
 
 
 def bert_clean(text):
@@ -400,9 +420,7 @@ def deduplicate_chars(seq_str, no_single=False):
 
 
 def de_specific(utter):
-    for pattern in DE_SPECIFIC:
-        utter = utter.replace(pattern, "")
-    return utter
+    return DE_SPECIFIC_REGEX.sub("", utter)
 
 
 # TODO Regex and words
@@ -413,6 +431,5 @@ if __name__ == "__main__":
     print("Testing the RegEx")
 
     test_text = "谁tM跟你在Tm一起了"
-    pat = re.compile(r"([^a-zA-Z])(tm)([^a-zA-Z])", re.I)
-    print(pat.sub(lambda m: m.group(1) + m.group(3), test_text))
+    print(TM_REGEX.sub("", test_text))
     print("over")
@@ -359,7 +359,7 @@ def utterance_clean(opt, file_id, utterance, tight_utter, blacklist, dirty_data,
             utterance = ""
 
     if utterance and opt.no_str_blacklist:
-        utterance = str_level.TM_REGEX.sub(lambda m: m.group(1) + m.group(3), utterance)
+        utterance = str_level.TM_REGEX.sub("", utterance)
         global MAX_LEN_STR_BLACKWORD
         black_word = str_level.de_str_blacklist2(tight_utter, blacklist["str_blacklist"], MAX_LEN_STR_BLACKWORD)
         if black_word: